@@ -10,7 +10,7 @@ Elderly Monitor – 단일 파일 웹사이트(Flask)
 
 실행 방법:
 1) Python 3.10+ 권장
-2) pip install -U flask flask_sqlalchemy pandas scikit-learn apscheduler
+2) pip install -U flask flask_sqlalchemy numpy apscheduler orjson
 3) python app.py 실행 후 http://127.0.0.1:5000 접속
 
 운영 참고:
@@ -19,19 +19,36 @@ Elderly Monitor – 단일 파일 웹사이트(Flask)
 - 데모/프로토타입 용도로 설계(보안/권한, 암호화, 감사로그 등은 운영 시 강화 필요)
 """
 
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, delete, func, and_, or_, event
+from sqlalchemy.orm import load_only
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
-from sklearn.ensemble import IsolationForest  # 선택적 사용(아래 주석 예시)
-import pandas as pd
+from apscheduler.executors.pool import ThreadPoolExecutor
 import numpy as np
-import json, math
+import functools, json, math, os, queue, threading, time
+import orjson
+
+try:
+    from numba import njit  # 선택 의존성: 설치되어 있으면 haversine_from_home을 JIT 컴파일
+except ImportError:
+    njit = None
+
+try:
+    import fcntl  # 스케줄러 단일 실행 잠금용(Unix 전용)
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///elderly_monitor.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JSON_AS_ASCII'] = False
+# gunicorn 스레드 + 검사 워커 + 스케줄러가 동시에 접근하므로 커넥션 풀 확대
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'connect_args': {'check_same_thread': False},
+}
 
 db = SQLAlchemy(app)
 
@@ -45,6 +62,8 @@ class User(db.Model):
     home_lon = db.Column(db.Float, nullable=True)
     geofence_m = db.Column(db.Integer, default=500)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 마지막으로 이상징후 검사를 마친 SensorReading.id (알림과 같은 트랜잭션에서 갱신, 워커 간 공유)
+    last_checked_id = db.Column(db.Integer, nullable=True)
 
 class SensorReading(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -58,6 +77,9 @@ class SensorReading(db.Model):
     door_open = db.Column(db.Integer, default=0)
     meta = db.Column(db.String, default='{}')
 
+    # 사용자별 최신값/기간 조회(user_id = ? AND timestamp >= ? ORDER BY timestamp DESC)용
+    __table_args__ = (db.Index('ix_sensor_user_ts', 'user_id', 'timestamp'),)
+
 class Alert(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
@@ -66,19 +88,93 @@ class Alert(db.Model):
     details = db.Column(db.String)
     sent_to = db.Column(db.String)
 
+    __table_args__ = (
+        db.Index('ix_alert_user_ts', 'user_id', 'timestamp'),
+        # 전체 알림 목록의 keyset 페이지네이션(ORDER BY timestamp DESC, id DESC)용
+        db.Index('ix_alert_ts_id', 'timestamp', 'id'),
+    )
+
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    # WAL: 쓰기 중에도 읽기 가능, synchronous=NORMAL: 커밋마다 fsync 하지 않음(WAL에서 안전)
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-20000')  # 약 20MB
+    cursor.close()
+
 with app.app_context():
-    db.create_all()
+    event.listen(db.engine, 'connect', _set_sqlite_pragmas)
+    # gunicorn 워커들이 동시에 시작하면 스키마 생성이 경합하므로 파일 잠금으로 한 번에 하나씩(Unix 전용)
+    _schema_lock = None
+    if fcntl is not None:
+        os.makedirs(app.instance_path, exist_ok=True)
+        _schema_lock = open(os.path.join(app.instance_path, 'schema.lock'), 'w')
+        fcntl.flock(_schema_lock, fcntl.LOCK_EX)
+    try:
+        db.create_all()
+        # 기존 DB 파일에는 create_all()이 새 컬럼을 추가하지 않으므로 직접 추가
+        if 'last_checked_id' not in {c['name'] for c in db.inspect(db.engine).get_columns('user')}:
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql('ALTER TABLE "user" ADD COLUMN last_checked_id INTEGER')
+        # 기존 DB 파일에는 create_all()이 인덱스를 추가하지 않으므로 직접 생성(IF NOT EXISTS)
+        for table in (SensorReading.__table__, Alert.__table__):
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+    finally:
+        if _schema_lock:
+            _schema_lock.close()  # 닫으면 잠금 해제
 
 # ----------------------------- 유틸 -----------------------------
 
-def haversine(lat1, lon1, lat2, lon2):
+def parse_timestamp(value):
+    # ISO 문자열 → naive UTC(DB의 다른 시각들과 비교 가능하도록 오프셋이 있으면 UTC로 변환)
+    ts = datetime.fromisoformat(value)
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def json_response(obj, status=200):
+    # jsonify 대신 orjson(C 구현, datetime은 ISO 8601 문자열로 직접 직렬화)
+    return Response(orjson.dumps(obj), status=status, mimetype='application/json')
+
+
+@functools.lru_cache(maxsize=1024)
+def home_radians(lat, lon):
+    """집 좌표 → (위도 rad, 경도 rad, cos(위도)). 좌표 값 자체가 키라 집 좌표가 바뀌면 새로 계산됨"""
+    phi = math.radians(lat)
+    return phi, math.radians(lon), math.cos(phi)
+
+
+def haversine_from_home(lat, lon, home_phi, home_lambda, home_cos_phi):
+    """(lat, lon)에서 집까지의 haversine 거리(m). 집 쪽 radians/cos는 home_radians() 값을 재사용"""
     R = 6371000
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    phi = math.radians(lat)
+    dphi = home_phi - phi
+    dlambda = home_lambda - math.radians(lon)
+    a = math.sin(dphi/2)**2 + math.cos(phi)*home_cos_phi*math.sin(dlambda/2)**2
     return 2 * R * math.asin(math.sqrt(a))
 
+if njit is not None:
+    # 시그니처 지정으로 import 시점에 컴파일, cache=True로 재시작 후에도 재사용
+    haversine_from_home = njit('float64(float64, float64, float64, float64, float64)', cache=True)(haversine_from_home)
+
+
+def haversine_from_home_vec(lat, lon, home_phi, home_lambda, home_cos_phi):
+    """haversine_from_home의 NumPy 배열 버전(여러 사용자를 한 번에 계산, 결측은 NaN)"""
+    R = 6371000
+    phi = np.radians(lat)
+    dphi = home_phi - phi
+    dlambda = home_lambda - np.radians(lon)
+    a = np.sin(dphi/2)**2 + np.cos(phi)*home_cos_phi*np.sin(dlambda/2)**2
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+
+def _coord_array(values):
+    # 좌표가 없거나 0이면(기존 스칼라 경로의 falsy 판정과 동일) NaN
+    return np.array([v if v else np.nan for v in values], dtype=np.float64)
+
 # ----------------------------- 알림(플레이스홀더) -----------------------------
 
 def send_email(to_email, subject, body):
@@ -89,134 +185,397 @@ def send_sms(to_phone, message):
     print(f"[SMS] to={to_phone} msg={message}")
 
 
-def record_and_send_alert(user_id, alert_type, details):
-    user = User.query.get(user_id)
+def record_and_send_alert(user, alert_type, details):
+    # 커밋은 호출 측에서(센서 저장/일괄 검사와 한 트랜잭션으로 묶기 위함)
     sent_to = []
-    if user and user.email:
+    if user.email:
         send_email(user.email, f"[알림] {alert_type}", details)
         sent_to.append(user.email)
-    if user and user.phone:
+    if user.phone:
         send_sms(user.phone, details)
         sent_to.append(user.phone)
-    alert = Alert(user_id=user_id, alert_type=alert_type, details=details, sent_to=",".join(sent_to))
+    alert = Alert(user_id=user.id, alert_type=alert_type, details=details, sent_to=",".join(sent_to))
     db.session.add(alert)
-    db.session.commit()
 
 # ----------------------------- 통계/베이스라인 -----------------------------
 
-def compute_baselines(user_id, lookback_days=14):
-    since = datetime.utcnow() - timedelta(days=lookback_days)
-    rows = SensorReading.query.filter(
-        SensorReading.user_id == user_id,
-        SensorReading.timestamp >= since
+BASELINE_METRICS = ['water_l', 'gas_m3', 'motion']
+BASELINE_LOOKBACK_DAYS = 14
+BASELINE_CACHE_TTL = 60  # 초
+
+# user_id -> (만료시각(monotonic), 상태) ; 상태 = {'count', 'last_id', 지표: [합계, M2]}
+_baseline_cache = {}
+# user_id -> 업로드 반영 횟수. 캐시 적재 중 업로드가 끼어들면 적재 결과를 버리기 위함
+_baseline_gen = {}
+_baseline_lock = threading.Lock()
+
+
+def _baseline_from_stats(count, total, var):
+    mean = total / count
+    # 값이 모두 같을 때 평균의 반올림 오차(1 ulp)로 생기는 미세한 분산은 0으로 취급.
+    # 상대 1e-12(표준편차 기준 평균의 1e-6배)는 float64 오차보다 충분히 크고 실제 변동보다는 충분히 작음
+    if var <= 1e-12 * mean * mean:
+        var = 0.0
+    return {'mean': mean, 'std': math.sqrt(var)}
+
+
+def _window_stats(user_ids, since):
+    """사용자별 기간 내 (user_id, COUNT, MAX(id), 지표별 SUM(x), AVG((x - 평균)²) ...) 행 목록.
+    분산은 E[x²] - E[x]² 대신 평균과의 편차로 계산(2-pass)해 상쇄 오차가 없음"""
+    window = (SensorReading.user_id.in_(user_ids), SensorReading.timestamp >= since)
+    means = (
+        select(SensorReading.user_id.label('uid'),
+               *[func.avg(getattr(SensorReading, m)).label(m) for m in BASELINE_METRICS])
+        .where(*window)
+        .group_by(SensorReading.user_id)
+        .subquery()
+    )
+    cols = []
+    for m in BASELINE_METRICS:
+        c, mc = getattr(SensorReading, m), means.c[m]
+        cols += [func.sum(c), func.avg((c - mc) * (c - mc))]
+    return db.session.execute(
+        select(SensorReading.user_id, func.count(), func.max(SensorReading.id), *cols)
+        .join(means, means.c.uid == SensorReading.user_id)
+        .where(*window)
+        .group_by(SensorReading.user_id)
     ).all()
-    if not rows:
+
+
+def _baselines_from_row(row):
+    # row: _window_stats()의 한 행
+    count = row[1]
+    return {
+        m: _baseline_from_stats(count, float(row[3 + 2 * i] or 0.0), float(row[4 + 2 * i] or 0.0))
+        for i, m in enumerate(BASELINE_METRICS)
+    }
+
+
+def _baselines_from_state(state):
+    n = state['count']
+    if not n:
         return {}
-    df = pd.DataFrame([{
-        'timestamp': r.timestamp,
-        'water_l': r.water_l,
-        'gas_m3': r.gas_m3,
-        'motion': r.motion
-    } for r in rows])
-    baselines = {}
-    for m in ['water_l', 'gas_m3', 'motion']:
-        mean = float(df[m].mean())
-        std = float(df[m].std(ddof=0) if len(df[m]) > 1 else 0.0)
-        baselines[m] = {'mean': mean, 'std': std}
-    return baselines
-
-
-def check_latest_for_user(user_id):
-    user = User.query.get(user_id)
-    if not user:
+    return {m: _baseline_from_stats(n, state[m][0], state[m][1] / n) for m in BASELINE_METRICS}
+
+
+def compute_baselines(user_id, lookback_days=BASELINE_LOOKBACK_DAYS):
+    use_cache = lookback_days == BASELINE_LOOKBACK_DAYS
+    if use_cache:
+        with _baseline_lock:
+            hit = _baseline_cache.get(user_id)
+            if hit and time.monotonic() < hit[0]:
+                return _baselines_from_state(hit[1])
+            gen = _baseline_gen.get(user_id, 0)
+
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    rows = _window_stats([user_id], since)
+    if not rows:
+        state = {'count': 0, 'last_id': 0}
+        state.update({m: [0.0, 0.0] for m in BASELINE_METRICS})
+    else:
+        row = rows[0]
+        state = {'count': row[1], 'last_id': row[2]}
+        for i, m in enumerate(BASELINE_METRICS):
+            # 합계는 그대로, M2 = n * 분산
+            state[m] = [float(row[3 + 2 * i] or 0.0), float(row[4 + 2 * i] or 0.0) * row[1]]
+
+    if use_cache:
+        with _baseline_lock:
+            # 조회 도중 업로드가 반영됐다면 이 결과엔 그 데이터가 빠졌을 수 있으므로 캐시하지 않음
+            if _baseline_gen.get(user_id, 0) == gen:
+                _baseline_cache[user_id] = (time.monotonic() + BASELINE_CACHE_TTL, state)
+    return _baselines_from_state(state)
+
+
+def update_cached_baselines(reading_id, reading):
+    """새 센서 데이터(reading: 컬럼명 → 값)를 캐시된 베이스라인에 반영(캐시가 없거나 만료되면 무시).
+    평균은 합계/개수로 계산하고 M2는 Welford 방식으로 누적"""
+    if reading['timestamp'] < datetime.utcnow() - timedelta(days=BASELINE_LOOKBACK_DAYS):
         return
-    last = SensorReading.query.filter_by(user_id=user_id).order_by(SensorReading.timestamp.desc()).first()
-    if not last:
+    user_id = reading['user_id']
+    with _baseline_lock:
+        _baseline_gen[user_id] = _baseline_gen.get(user_id, 0) + 1
+        hit = _baseline_cache.get(user_id)
+        if not hit or time.monotonic() >= hit[0]:
+            return
+        state = hit[1]
+        # 캐시 적재 쿼리에 이미 포함된 데이터는 중복 반영하지 않음
+        if reading_id <= state['last_id']:
+            return
+        n = state['count']
+        state['count'] = n + 1
+        state['last_id'] = reading_id
+        for m in BASELINE_METRICS:
+            x = float(reading[m])
+            total, m2 = state[m]
+            old_mean = total / n if n else x
+            total += x
+            state[m] = [total, m2 + (x - old_mean) * (x - total / (n + 1))]
+
+
+def compute_baselines_all(user_ids, lookback_days=BASELINE_LOOKBACK_DAYS):
+    """여러 사용자의 베이스라인을 한 번의 집계 쿼리로 계산 → {user_id: baselines}"""
+    if not user_ids:
+        return {}
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    return {row[0]: _baselines_from_row(row) for row in _window_stats(user_ids, since)}
+
+
+def latest_readings_all(user_ids):
+    """사용자별 최신 센서 데이터를 한 번의 쿼리로 조회 → {user_id: SensorReading}"""
+    if not user_ids:
+        return {}
+    latest_ts = (
+        select(SensorReading.user_id, func.max(SensorReading.timestamp).label('ts'))
+        .where(SensorReading.user_id.in_(user_ids))
+        .group_by(SensorReading.user_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(SensorReading).join(latest_ts, and_(
+            SensorReading.user_id == latest_ts.c.user_id,
+            SensorReading.timestamp == latest_ts.c.ts
+        ))
+    ).scalars().all()
+    return {r.user_id: r for r in rows}
+
+
+# (지표, 표시명, 단위, 평균 표시 형식, '거의 사용 없음' 평균 기준, 급증 기준)
+RESOURCE_RULES = (
+    ('water_l', '수도', 'L', '.1f', 0.1, 5),
+    ('gas_m3', '가스', 'm³', '.2f', 0.01, 0.1),
+)
+RESOURCE_IDLE_MEAN = np.array([r[4] for r in RESOURCE_RULES])
+RESOURCE_SPIKE = np.array([r[5] for r in RESOURCE_RULES])
+
+
+def claim_reading(user_id, reading_id):
+    """last_checked_id를 reading_id로 선점(조건부 UPDATE). 이 트랜잭션이 선점했으면 True,
+    다른 스레드/프로세스가 이미 검사했으면 False. 커밋 전까지 SQLite 쓰기 잠금으로 직렬화되고,
+    롤백되면 선점도 함께 취소됨(알림 기록과 같은 트랜잭션)"""
+    result = db.session.execute(
+        update(User)
+        .where(User.id == user_id,
+               or_(User.last_checked_id.is_(None), User.last_checked_id != reading_id))
+        .values(last_checked_id=reading_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def check_latest_for_user(user):
+    last = SensorReading.query.filter_by(user_id=user.id).order_by(SensorReading.timestamp.desc()).first()
+    # 알림 발송 전에 선점: 이미 검사했거나 다른 쪽이 검사 중이면 건너뜀. 커밋은 호출 측에서
+    if not last or not claim_reading(user.id, last.id):
         return
+    evaluate_reading(user, last, compute_baselines(user.id))
+
 
-    baselines = compute_baselines(user_id)
+def evaluate_reading(user, last, baselines, distance=None):
+    """최신 데이터(last)를 베이스라인과 비교해 이상징후 판정 및 알림 (DB 조회 없음)
+    distance: 미리 계산한 집까지의 거리(m). 없으면 여기서 계산"""
     details = []
     high_risk = False
-
-    # 수도 이상 탐지
-    if 'water_l' in baselines and baselines['water_l']['std'] > 0:
-        z = (last.water_l - baselines['water_l']['mean']) / baselines['water_l']['std']
-        if abs(z) >= 3:
-            details.append(f"수도 사용량 이상: 최근={last.water_l}L, 평균={baselines['water_l']['mean']:.1f}L, z={z:.2f}")
-            if z > 3:
-                high_risk = True
-    else:
-        if baselines.get('water_l', {}).get('mean', 0) < 0.1 and last.water_l > 5:
-            details.append(f"수도 사용 급증: {last.water_l}L (평소 거의 사용 없음)")
-            high_risk = True
-
-    # 가스 이상 탐지
-    if 'gas_m3' in baselines and baselines['gas_m3']['std'] > 0:
-        z = (last.gas_m3 - baselines['gas_m3']['mean']) / baselines['gas_m3']['std']
-        if abs(z) >= 3:
-            details.append(f"가스 사용량 이상: 최근={last.gas_m3}m³, 평균={baselines['gas_m3']['mean']:.2f}m³, z={z:.2f}")
-            if z > 3:
-                high_risk = True
-    else:
-        if baselines.get('gas_m3', {}).get('mean', 0) < 0.01 and last.gas_m3 > 0.1:
-            details.append(f"가스 사용 급증: {last.gas_m3}m³ (평소 거의 사용 없음)")
-            high_risk = True
+    saw_abnormal = False  # 자원/활동 이상·급증 항목이 있었는지(복합 규칙용)
+
+    # 수도/가스 이상 탐지: 두 지표의 z-score와 임계값 판정을 배열 연산 한 번으로
+    values = [getattr(last, r[0]) for r in RESOURCE_RULES]
+    x = np.array(values, dtype=np.float64)
+    mu = np.array([baselines.get(r[0], {}).get('mean', 0.0) for r in RESOURCE_RULES])
+    sd = np.array([baselines.get(r[0], {}).get('std', 0.0) for r in RESOURCE_RULES])
+    has_sd = sd > 0
+    z = np.divide(x - mu, sd, out=np.zeros_like(x), where=has_sd)
+    abnormal = has_sd & (np.abs(z) >= 3)
+    # 표준편차가 없으면(데이터 부족/항상 같은 값) 평소 거의 안 쓰다가 급증했는지로 판정
+    spike = ~has_sd & (mu < RESOURCE_IDLE_MEAN) & (x > RESOURCE_SPIKE)
+    flagged = np.flatnonzero(abnormal | spike)
+    if flagged.size:
+        saw_abnormal = True
+    for i in flagged:
+        _, label, unit, mean_fmt = RESOURCE_RULES[i][:4]
+        if abnormal[i]:
+            details.append(f"{label} 사용량 이상: 최근={values[i]}{unit}, 평균={mu[i]:{mean_fmt}}{unit}, z={z[i]:.2f}")
+        else:
+            details.append(f"{label} 사용 급증: {values[i]}{unit} (평소 거의 사용 없음)")
+    if ((has_sd & (z > 3)) | spike).any():
+        high_risk = True
 
     # 활동 이상
     if 'motion' in baselines:
         mean = baselines['motion']['mean']
         if mean >= 0.5 and last.motion == 0:
             details.append("활동 이상(평소 활동적이나 현재 무활동)")
+            saw_abnormal = True
         if mean < 0.2 and last.motion == 1:
             details.append("활동 이상(평소 거의 없음에도 현재 활동 감지)")
+            saw_abnormal = True
 
-    # 지오펜스
+    # 지오펜스 / 복합 규칙: 집까지 거리는 한 번만 계산해 두 규칙에서 같이 사용
     if last.lat and last.lon and user.home_lat and user.home_lon:
-        d = haversine(last.lat, last.lon, user.home_lat, user.home_lon)
-        if d > user.geofence_m:
+        d = distance if distance is not None else haversine_from_home(
+            last.lat, last.lon, *home_radians(user.home_lat, user.home_lon))
+        at_home = d <= user.geofence_m
+
+        # 지오펜스
+        if not at_home:
             details.append(f"지오펜스 이탈: 거리 {int(d)}m (설정 {user.geofence_m}m)")
             if last.timestamp.hour >= 23 or last.timestamp.hour < 6:
                 high_risk = True
 
-    # 복합 규칙: 집 안 + 자원 급증
-    if last.lat and last.lon and user.home_lat and user.home_lon:
-        d = haversine(last.lat, last.lon, user.home_lat, user.home_lon)
-        at_home = d <= user.geofence_m
-        if at_home and any(("급증" in s) or ("이상" in s) for s in details):
+        # 복합 규칙: 집 안 + 자원 급증
+        if at_home and saw_abnormal:
             high_risk = True
 
     if details:
         level = "HIGH" if high_risk else "LOW"
         rec = "; ".join(details)
-        record_and_send_alert(user_id, f"{level} 이상징후", rec)
+        record_and_send_alert(user, f"{level} 이상징후", rec)
 
 # ----------------------------- 스케줄러 -----------------------------
 
-sched = BackgroundScheduler()
+# 작업은 스레드 하나에서 순서대로, 밀린 실행은 한 번으로 합침
+sched = BackgroundScheduler(
+    executors={'default': ThreadPoolExecutor(max_workers=1)},
+    job_defaults={'coalesce': True, 'max_instances': 1},
+)
 
 @sched.scheduled_job('interval', minutes=15)
 def periodic_check_all():
-    users = User.query.all()
-    for u in users:
-        check_latest_for_user(u.id)
-
-sched.start()
+    # 사용자 수와 무관하게 조회 3회(사용자/최신값/베이스라인)로 일괄 검사
+    with app.app_context():
+        # 판정/알림에 쓰는 컬럼만 로드(이후 재조회 없이 이 객체를 그대로 전달)
+        users = User.query.options(load_only(
+            User.id, User.phone, User.email, User.home_lat, User.home_lon, User.geofence_m,
+            User.last_checked_id
+        )).all()
+        latest = latest_readings_all([u.id for u in users])
+        # 직전 검사 이후 새 데이터가 없는 사용자는 건너뜀(베이스라인 집계도 대상자만)
+        pairs = [(u, latest[u.id]) for u in users if u.id in latest and u.last_checked_id != latest[u.id].id]
+        if not pairs:
+            return
+        baselines = compute_baselines_all([u.id for u, _ in pairs])
+        # 지오펜스 거리는 전체 사용자를 한 번에 벡터 계산(좌표 없으면 NaN)
+        nan_home = (np.nan, np.nan, np.nan)
+        home = np.array([
+            home_radians(u.home_lat, u.home_lon) if u.home_lat and u.home_lon else nan_home
+            for u, _ in pairs
+        ], dtype=np.float64)
+        dists = haversine_from_home_vec(
+            _coord_array(last.lat for _, last in pairs), _coord_array(last.lon for _, last in pairs),
+            home[:, 0], home[:, 1], home[:, 2]
+        )
+        # 사용자별로 커밋: 한 사용자의 실패가 이미 발송된 다른 사용자의 알림 기록을 되돌리지 않도록
+        for (u, last), d in zip(pairs, dists):
+            user_id, reading_id = u.id, last.id
+            try:
+                # 업로드 검사 워커가 같은 데이터를 먼저 선점했으면 알림 없이 건너뜀
+                if not claim_reading(user_id, reading_id):
+                    db.session.rollback()
+                    continue
+                evaluate_reading(u, last, baselines.get(user_id, {}), None if np.isnan(d) else float(d))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[CHECK] user_id={user_id} 검사 실패: {e}")
+
+
+READING_RETENTION_DAYS = 30  # 베이스라인 기간(14일)보다 충분히 길게
+
+@sched.scheduled_job('cron', hour=3)
+def prune_old_readings():
+    # 베이스라인에 쓰이지 않는 오래된 센서 데이터 삭제(인덱스 깊이/DB 파일 크기 억제)
+    with app.app_context():
+        cutoff = datetime.utcnow() - timedelta(days=READING_RETENTION_DAYS)
+        result = db.session.execute(delete(SensorReading).where(SensorReading.timestamp < cutoff))
+        db.session.commit()
+        # WAL 내용을 본 DB에 반영하고 -wal 파일을 비움
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+        print(f"[PRUNE] {result.rowcount}건 삭제 (기준 {cutoff.isoformat()})")
+
+
+def _acquire_scheduler_lock():
+    """gunicorn 워커가 여러 개여도 스케줄러는 한 프로세스에서만 돌도록 파일 잠금(비차단) 획득.
+    잠금을 잡은 파일 객체를 반환(프로세스가 살아 있는 동안 유지), 실패 시 None"""
+    if os.environ.get('SCHEDULER_ENABLED', '1') == '0':
+        return None
+    if fcntl is None:
+        # Windows 등: 단일 프로세스 개발 서버로 간주
+        return True
+    os.makedirs(app.instance_path, exist_ok=True)
+    f = open(os.path.join(app.instance_path, 'scheduler.lock'), 'w')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+_scheduler_lock = _acquire_scheduler_lock()
+if _scheduler_lock:
+    sched.start()
+
+# ----------------------------- 검사 워커 -----------------------------
+
+check_queue = queue.Queue()
+_pending_checks = set()
+_pending_lock = threading.Lock()
+
+
+def enqueue_check(user_id):
+    """업로드 후 검사를 워커 스레드로 넘김(같은 사용자가 이미 대기 중이면 합침)"""
+    with _pending_lock:
+        if user_id in _pending_checks:
+            return
+        _pending_checks.add(user_id)
+    check_queue.put_nowait(user_id)
+
+
+def _check_worker():
+    while True:
+        user_id = check_queue.get()
+        # 검사 시작 전에 대기 표시를 지워야 검사 중 들어온 업로드가 다시 큐에 들어감
+        with _pending_lock:
+            _pending_checks.discard(user_id)
+        try:
+            with app.app_context():
+                user = db.session.get(User, user_id)
+                if user:
+                    check_latest_for_user(user)
+                    db.session.commit()
+        except Exception as e:
+            print(f"[CHECK] user_id={user_id} 검사 실패: {e}")
+        finally:
+            check_queue.task_done()
+
+threading.Thread(target=_check_worker, name='check-worker', daemon=True).start()
 
 # ----------------------------- API -----------------------------
 
+MAX_PAGE_SIZE = 200
+
+
+def page_limit(default):
+    return max(1, min(int(request.args.get('limit', default)), MAX_PAGE_SIZE))
+
+
 @app.route('/api/users', methods=['GET'])
 def api_list_users():
-    users = User.query.order_by(User.id.asc()).all()
-    return jsonify([{
-        'id': u.id,
-        'name': u.name,
-        'phone': u.phone,
-        'email': u.email,
-        'home_lat': u.home_lat,
-        'home_lon': u.home_lon,
-        'geofence_m': u.geofence_m,
-        'created_at': u.created_at.isoformat()
-    } for u in users])
+    # keyset 페이지네이션: ?after_id=<마지막 id>&limit=N → {'items': [...], 'next': 다음 after_id 또는 null}
+    try:
+        after_id = int(request.args.get('after_id', 0))
+        limit = page_limit(50)
+    except ValueError:
+        return json_response({'status': 'error', 'message': 'after_id/limit는 정수여야 합니다'}, 400)
+    # ORM 객체 대신 Row 튜플로 조회해 바로 dict 변환
+    rows = db.session.execute(
+        select(User.id, User.name, User.phone, User.email, User.home_lat, User.home_lon,
+               User.geofence_m, User.created_at)
+        .where(User.id > after_id).order_by(User.id.asc()).limit(limit + 1)
+    ).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    items = [r._asdict() for r in rows[:limit]]
+    return json_response({'items': items, 'next': next_cursor})
 
 
 @app.route('/api/users', methods=['POST'])
@@ -232,58 +591,73 @@ def api_create_user():
     )
     db.session.add(u)
     db.session.commit()
-    return jsonify({'status': 'ok', 'user_id': u.id})
+    return json_response({'status': 'ok', 'user_id': u.id})
 
 
 @app.route('/api/sensor', methods=['POST'])
 def api_upload_sensor():
     data = request.json
-    r = SensorReading(
-        user_id=int(data['user_id']),
-        timestamp=datetime.fromisoformat(data.get('timestamp')) if data.get('timestamp') else datetime.utcnow(),
-        lat=data.get('lat'),
-        lon=data.get('lon'),
-        water_l=float(data.get('water_l', 0)),
-        gas_m3=float(data.get('gas_m3', 0)),
-        motion=int(data.get('motion', 0)),
-        door_open=int(data.get('door_open', 0)),
-        meta=json.dumps(data.get('meta', {}))
-    )
-    db.session.add(r)
+    values = {
+        'user_id': int(data['user_id']),
+        'timestamp': parse_timestamp(data.get('timestamp')) if data.get('timestamp') else datetime.utcnow(),
+        'lat': data.get('lat'),
+        'lon': data.get('lon'),
+        'water_l': float(data.get('water_l', 0)),
+        'gas_m3': float(data.get('gas_m3', 0)),
+        'motion': int(data.get('motion', 0)),
+        'door_open': int(data.get('door_open', 0)),
+        'meta': json.dumps(data.get('meta', {}))
+    }
+    # ORM 객체 없이 Core insert
+    result = db.session.execute(insert(SensorReading).values(**values))
     db.session.commit()
-    # 업로드 즉시 체크
-    check_latest_for_user(r.user_id)
-    return jsonify({'status': 'ok'})
+    # 커밋된 데이터만 캐시에 반영
+    update_cached_baselines(result.inserted_primary_key[0], values)
+    # 이상징후 검사는 워커 스레드에서(응답 지연 없음)
+    enqueue_check(values['user_id'])
+    return json_response({'status': 'ok'})
 
 
 @app.route('/api/latest', methods=['GET'])
 def api_latest_reading():
     user_id = int(request.args.get('user_id'))
-    r = SensorReading.query.filter_by(user_id=user_id).order_by(SensorReading.timestamp.desc()).first()
+    r = db.session.execute(
+        select(SensorReading.timestamp, SensorReading.lat, SensorReading.lon, SensorReading.water_l,
+               SensorReading.gas_m3, SensorReading.motion, SensorReading.door_open)
+        .where(SensorReading.user_id == user_id)
+        .order_by(SensorReading.timestamp.desc()).limit(1)
+    ).first()
     if not r:
-        return jsonify({'status': 'no data'})
-    return jsonify({
-        'timestamp': r.timestamp.isoformat(),
-        'lat': r.lat, 'lon': r.lon,
-        'water_l': r.water_l, 'gas_m3': r.gas_m3, 'motion': r.motion, 'door_open': r.door_open
-    })
+        return json_response({'status': 'no data'})
+    return json_response(r._asdict())
 
 
 @app.route('/api/alerts', methods=['GET'])
 def api_alerts():
-    user_id = request.args.get('user_id')
-    q = Alert.query
-    if user_id:
-        q = q.filter_by(user_id=int(user_id))
-    alerts = q.order_by(Alert.timestamp.desc()).limit(200).all()
-    return jsonify([{
-        'id': a.id,
-        'user_id': a.user_id,
-        'timestamp': a.timestamp.isoformat(),
-        'alert_type': a.alert_type,
-        'details': a.details,
-        'sent_to': a.sent_to
-    } for a in alerts])
+    # keyset 페이지네이션(최신순): ?cursor=<timestamp>_<id>&limit=N → {'items': [...], 'next': 다음 cursor 또는 null}
+    try:
+        user_id = int(request.args['user_id']) if request.args.get('user_id') else None
+        limit = page_limit(MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        if cursor:
+            ts, last_id = cursor.rsplit('_', 1)
+            ts, last_id = datetime.fromisoformat(ts), int(last_id)
+    except ValueError:
+        return json_response({'status': 'error', 'message': '잘못된 user_id/limit/cursor 값입니다'}, 400)
+    stmt = select(Alert.id, Alert.user_id, Alert.timestamp, Alert.alert_type, Alert.details, Alert.sent_to)
+    if user_id is not None:
+        stmt = stmt.where(Alert.user_id == user_id)
+    if cursor:
+        stmt = stmt.where(or_(Alert.timestamp < ts, and_(Alert.timestamp == ts, Alert.id < last_id)))
+    rows = db.session.execute(
+        stmt.order_by(Alert.timestamp.desc(), Alert.id.desc()).limit(limit + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        a = rows[limit - 1]
+        next_cursor = f"{a.timestamp.isoformat()}_{a.id}"
+    items = [r._asdict() for r in rows[:limit]]
+    return json_response({'items': items, 'next': next_cursor})
 
 # ----------------------------- 웹 UI -----------------------------
 INDEX_HTML = """
@@ -400,8 +774,14 @@ INDEX_HTML = """
 let currentUser = null;
 
 async function loadUsers(){
-  const res = await fetch('/api/users');
-  const users = await res.json();
+  let users = [], after = 0;
+  while(true){
+    const res = await fetch(`/api/users?after_id=${after}&limit=200`);
+    const page = await res.json();
+    users = users.concat(page.items);
+    if(page.next===null) break;
+    after = page.next;
+  }
   const list = document.getElementById('userList');
   list.innerHTML = '';
   const sel = document.getElementById('uploadUser');
@@ -439,7 +819,7 @@ async function loadAlerts(){
   const tbody = document.getElementById('alertTable');
   const uidParam = currentUser? `?user_id=${currentUser.id}` : '';
   const res = await fetch('/api/alerts'+uidParam);
-  const rows = await res.json();
+  const rows = (await res.json()).items;
   tbody.innerHTML = '';
   rows.forEach(a=>{
     const tr = document.createElement('tr');
@@ -498,9 +878,14 @@ loadUsers();
 </html>
 """
 
+# 템플릿 변수가 없으므로 Jinja 렌더링 없이 시작 시 한 번만 인코딩
+_INDEX_BYTES = INDEX_HTML.encode('utf-8')
+
 @app.route('/')
 def index():
-    return render_template_string(INDEX_HTML)
+    resp = Response(_INDEX_BYTES, mimetype='text/html')
+    resp.headers['Cache-Control'] = 'public, max-age=300'
+    return resp
 
 
 if __name__ == '__main__':
@@ -515,9 +900,9 @@ if __name__ == '__main__':
 ```
 flask==3.0.3
 flask_sqlalchemy==3.1.1
-pandas==2.2.2
-scikit-learn==1.5.2
+numpy==1.26.4
 apscheduler==3.10.4
+orjson==3.10.7
 gunicorn==22.0.0
 ```
 